@@ -1,37 +1,156 @@
+import asyncio
+import collections
 import subprocess
 import os
-import re
+import shlex
+import shutil
+import socket
 import time
 import statistics
-import random
 import string
+from pathlib import Path
 
 def run_command_in_background(command):
     """
     Run a command in the background using subprocess.Popen.
     """
-    print(f"Starting command: {command}")
-    process = subprocess.Popen(command, shell=True)
+    print(f"Starting command: {shlex.join(command)}")
+    # Servers log to their own files; stderr is inherited so startup errors stay visible.
+    # Without a shell, close_fds or a new session, CPython launches the process with
+    # posix_spawn instead of fork + exec.
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, close_fds=False)
     return process
 
-def run_command(command):
+def server_address(command):
     """
-    Run a command and wait for it to complete, returning elapsed time.
+    Return the IP:Port a server command listens on, given after its -a flag.
     """
-    print(f"Executing: {command}")
-    start_time = time.time()
-    result = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    end_time = time.time()
-    elapsed_time = end_time - start_time
+    return command[command.index("-a") + 1]
 
-    if result.returncode != 0:
-        print(f"Error: {result.stderr.decode('utf-8')}")
-    else:
-        print(f"Success: {result.stdout.decode('utf-8')}")
+def wait_for_port(process, address, timeout):
+    """
+    Poll a server's IP:Port until it accepts TCP connections, backing off exponentially.
+    """
+    # Returns False if the server process exits or the timeout expires first
+    host, port = address.split(":")
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while True:
+        try:
+            socket.create_connection((host, int(port)), timeout=0.1).close()
+            return True
+        except OSError:
+            if process.poll() is not None:
+                print(f"Error: server for {address} exited with code {process.returncode}")
+                return False
+            if time.monotonic() >= deadline:
+                print(f"Error: {address} is not accepting connections after {timeout} seconds")
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+def wait_for_servers(commands, processes, timeout=10):
+    """
+    Wait until every server started by the given commands is listening on its IP:Port.
+    """
+    for cmd, process in zip(commands, processes):
+        if not wait_for_port(process, server_address(cmd), timeout):
+            raise RuntimeError(f"Server failed to start: {shlex.join(cmd)}")
+
+REPL_STATUS_MARKER = b"__REPL_STATUS__"
+VERBOSE = False  # Print every command and the output of successful ones
+BATCH_LIST_FILE = "test_batch_list.txt"
+PAYLOAD_TEMPLATE_FILE = "test_payload_template.txt"  # Kept next to the test files so they can hard-link to it
+NS_PER_SECOND = 1_000_000_000
+NS_PER_MS = 1_000_000
+OUTPUT_TAIL_LINES = 20  # Client output lines kept for error reports
+DROP_CACHES_FILE = "/proc/sys/vm/drop_caches"
+
+async def read_client_status(client):
+    """
+    Read a client's output up to its next status line, returning the status and the last lines before it.
+    """
+    # Earlier lines are discarded unless VERBOSE, so output never accumulates across commands
+    output = collections.deque(maxlen=None if VERBOSE else OUTPUT_TAIL_LINES)
+    while True:
+        try:
+            line = await client.stdout.readline()
+        except ValueError:
+            continue  # The stream drops lines over its 64 KiB limit; they are never status lines
+        if not line:
+            return "exited", output
+        if line.startswith(REPL_STATUS_MARKER):
+            return line[len(REPL_STATUS_MARKER):].strip().decode("utf-8"), output
+        output.append(line)
+
+async def start_client():
+    """
+    Start a long-lived client that reads commands from stdin and wait until it is connected.
+    """
+    print("Starting client: target/release/client repl")
+    client = await asyncio.create_subprocess_exec(
+        "target/release/client", "repl", stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+    status, output = await read_client_status(client)
+    if status != "ready":
+        if client.returncode is None:
+            client.kill()
+        await client.wait()
+        raise RuntimeError(f"Client failed to start:\n{b''.join(output).decode('utf-8', errors='replace')}")
+    return client
+
+async def stop_client(client):
+    """
+    Close the client's stdin so that its command loop exits, then wait for it.
+    """
+    client.stdin.close()
+    await client.wait()
+
+async def run_client_command(client, command):
+    """
+    Send a command to a running client and wait for it to complete, returning elapsed nanoseconds.
+    """
+    if VERBOSE:
+        print(f"Executing: {command}")
+    start_ns = time.perf_counter_ns()
+    client.stdin.write(f"{command}\n".encode("utf-8"))
+    await client.stdin.drain()
+    status, output = await read_client_status(client)
+    elapsed_ns = time.perf_counter_ns() - start_ns
+
+    if status != "ok":
+        print(f"Error: {b''.join(output).decode('utf-8', errors='replace')}")
+    elif VERBOSE:
+        print(f"Success: {b''.join(output).decode('utf-8', errors='replace')}")
+
+    return elapsed_ns  # Return the time taken for this command
+
+async def run_on_files(clients, operation, file_names, use_batch):
+    """
+    Run an operation on every file, returning the elapsed nanoseconds attributed to each file.
+    Without batching each client handles one file and all clients run concurrently; with
+    batching the first client handles every file listed in BATCH_LIST_FILE in one command and
+    its time is split evenly.
+    """
+    if not use_batch:
+        return await asyncio.gather(*(
+            run_client_command(client, f"{operation} {file_name}")
+            for client, file_name in zip(clients, file_names)
+        ))
+
+    elapsed_ns = await run_client_command(clients[0], f"{operation} --batch {BATCH_LIST_FILE}")
+    return [elapsed_ns // len(file_names)] * len(file_names)
 
-    return elapsed_time  # Return the time taken for this command
+def latency_percentiles(times):
+    """
+    Return the p50, p95 and p99 of the per-file elapsed nanoseconds.
+    """
+    if len(times) < 2:
+        return times[0], times[0], times[0]
+    cut_points = statistics.quantiles(times, n=100, method="inclusive")
+    return cut_points[49], cut_points[94], cut_points[98]
 
-def save_performance_results(file_name, total_time, avg_time, throughput, client_num, file_size_kb, test_type):
+def save_performance_results(file_name, total_ns, avg_ns, percentiles_ns, throughput, client_num, file_size_kb, test_type):
     """
     Save the performance results to a file inside the performance_results folder.
     """
@@ -45,100 +164,147 @@ def save_performance_results(file_name, total_time, avg_time, throughput, client
         f.write(f"Performance Metrics for {test_type} Test\n")
         f.write(f"Total Files {test_type}: {client_num}\n")
         f.write(f"File Size: {file_size_kb} KB\n")
-        f.write(f"Total Time Taken: {total_time:.2f} seconds\n")
-        f.write(f"Average {test_type} Time: {avg_time:.2f} seconds\n")
+        f.write(f"Total Time Taken: {total_ns / NS_PER_SECOND:.3f} seconds\n")
+        f.write(f"Average {test_type} Time: {avg_ns / NS_PER_MS:.3f} ms\n")
+        if percentiles_ns is not None:
+            f.write(f"{test_type} Time p50/p95/p99: {percentiles_ns[0] / NS_PER_MS:.3f}/{percentiles_ns[1] / NS_PER_MS:.3f}/{percentiles_ns[2] / NS_PER_MS:.3f} ms\n")
         f.write(f"Throughput: {throughput:.2f} KB/s\n")
     print(f"{test_type} performance results saved to {file_path}")
 
-def generate_utf8_file(file_name, file_size_kb):
+def generate_utf8_payload(file_size_kb):
     """
-    Generate a file with valid UTF-8 text content.
+    Generate valid UTF-8 text content of the given size.
     """
-    chars = string.ascii_letters + string.digits + " \n"
+    chars = (string.ascii_letters + string.digits + " \n").encode("ascii")
+    # Map every random byte onto the charset (256 is a multiple of its 64 characters)
+    table = bytes(chars[b % len(chars)] for b in range(256))
     total_chars = file_size_kb * 1024  # Total size in bytes
-    with open(file_name, "w", encoding="utf-8") as f:
-        for _ in range(total_chars):
-            f.write(random.choice(chars))
+    return os.urandom(total_chars).translate(table)
+
+def create_test_files(file_names, file_size_kb):
+    """
+    Write one payload to a template file and hard-link every test file to it.
+    """
+    with open(PAYLOAD_TEMPLATE_FILE, "wb") as f:
+        f.write(generate_utf8_payload(file_size_kb))
+    for file_name in file_names:
+        Path(file_name).unlink(missing_ok=True)  # os.link does not replace existing files
+        try:
+            os.link(PAYLOAD_TEMPLATE_FILE, file_name)
+        except OSError:
+            shutil.copyfile(PAYLOAD_TEMPLATE_FILE, file_name)  # Hard links are not supported here
+
+def write_batch_list(file_names):
+    """
+    List the test files in BATCH_LIST_FILE, one per line, for batch commands.
+    """
+    with open(BATCH_LIST_FILE, "w") as f:
+        f.write("\n".join(file_names) + "\n")
+
+def remove_files(file_names):
+    """
+    Remove the local test files in a single pass once testing has finished.
+    """
+    for file_name in file_names:
+        Path(file_name).unlink(missing_ok=True)
+    print(f"Cleaned up {len(file_names)} local test files")
+
+def drop_page_cache():
+    """
+    Flush dirty pages and drop the OS page cache so that reads are served from storage.
+    """
+    if not hasattr(os, "geteuid") or os.geteuid() != 0 or not os.path.exists(DROP_CACHES_FILE):
+        print("Skipping page cache drop: requires root on Linux")
+        return False
+    os.sync()
+    try:
+        with open(DROP_CACHES_FILE, "w") as f:
+            f.write("3\n")  # Free the page cache, dentries and inodes
+    except OSError as e:
+        print(f"Skipping page cache drop: {e}")
+        return False
+    return True
 
-def main():
+async def main():
     # Configuration
     client_num = 5        # Number of clients for testing
     file_size_kb = 2      # Size of each test file in KB
-    sleep_interval = 1    # Time to wait between operations
-
-    # Step 1: Start Master nodes in the background
-    print("Starting Master nodes...")
-    master_commands = [
-        "target/release/master -a 127.0.0.1:50001",
-        "target/release/master -a 127.0.0.1:50002",
-        "target/release/master -a 127.0.0.1:50003"
-    ]
-    master_processes = [run_command_in_background(command) for command in master_commands]
-
-    # Step 2: Start ChunkServer nodes in the background
-    print("Starting ChunkServer nodes...")
-    chunkserver_commands = [
-        "target/release/chunkserver -a 127.0.0.1:50010",
-        "target/release/chunkserver -a 127.0.0.1:50011"
-    ]
-
-    # Cleanup directories for ChunkServer nodes
-    pattern = r"(\d+\.\d+\.\d+\.\d+:\d+)"
-    for cmd in chunkserver_commands:
-        match = re.search(pattern, cmd)
-        if match:
-            directory = match.group(1).replace(":", "_")
-            os.system(f"rm -rf {directory}")
-
-    chunkserver_processes = [run_command_in_background(command) for command in chunkserver_commands]
-    time.sleep(2)  # Give servers time to start
-
-    # Step 3: Upload Performance Test
-    print("Starting upload performance test...")
-    upload_times = []
-    for i in range(client_num):
-        file_name = f"test_file_upload_{i}.txt"
-        generate_utf8_file(file_name, file_size_kb)
-
-        upload_command = f"target/release/client upload {file_name}"
-        elapsed_time = run_command(upload_command)
-        upload_times.append(elapsed_time)
-
-        os.remove(file_name)
-        time.sleep(sleep_interval)
-
-    # Calculate and save upload metrics
-    # total_time = sum(upload_times)
-    # avg_time = statistics.mean(upload_times)
-    # throughput = (client_num * file_size_kb) / total_time
-    # save_performance_results("upload_performance_results.txt", total_time, avg_time, throughput, client_num, file_size_kb, "Upload")
-
-    # Step 4: Read Performance Test
-    print("Starting read performance test...")
-    read_times = []
-    for i in range(client_num):
-        file_name = f"test_file_read_{i}.txt"
-        generate_utf8_file(file_name, file_size_kb)
-
-        upload_command = f"target/release/client upload {file_name}"
-        run_command(upload_command)
-
-        read_command = f"target/release/client read {file_name}"
-        elapsed_time = run_command(read_command)
-        read_times.append(elapsed_time)
-
-        os.remove(file_name)
-        time.sleep(sleep_interval)
-
-    # Calculate and save read metrics
-    total_time_read = sum(read_times)
-    avg_time_read = statistics.mean(read_times)
-    throughput_read = (client_num * file_size_kb) / total_time_read
-    save_performance_results("read_performance_results.txt", total_time_read, avg_time_read, throughput_read, client_num, file_size_kb, "Read")
-
-    # Wait for all background processes to finish
-    for process in master_processes + chunkserver_processes:
-        process.terminate()
+    use_batch = False     # Send all files through one client as a single batch command
+    cold_cache = True     # Drop the OS page cache before the read test (Linux, root only)
+
+    server_processes = []
+    try:
+        # Step 1: Start Master nodes in the background
+        print("Starting Master nodes...")
+        master_commands = [
+            ["target/release/master", "-a", "127.0.0.1:50001"],
+            ["target/release/master", "-a", "127.0.0.1:50002"],
+            ["target/release/master", "-a", "127.0.0.1:50003"]
+        ]
+        master_processes = [run_command_in_background(command) for command in master_commands]
+        server_processes += master_processes
+        wait_for_servers(master_commands, master_processes)  # ChunkServers register with the master on startup
+
+        # Step 2: Start ChunkServer nodes in the background
+        print("Starting ChunkServer nodes...")
+        chunkserver_commands = [
+            ["target/release/chunkserver", "-a", "127.0.0.1:50010"],
+            ["target/release/chunkserver", "-a", "127.0.0.1:50011"]
+        ]
+
+        # Cleanup directories for ChunkServer nodes
+        for cmd in chunkserver_commands:
+            directory = server_address(cmd).replace(":", "_")
+            shutil.rmtree(directory, ignore_errors=True)
+
+        chunkserver_processes = [run_command_in_background(command) for command in chunkserver_commands]
+        server_processes += chunkserver_processes
+        wait_for_servers(chunkserver_commands, chunkserver_processes)
+
+        # Step 3: Upload Performance Test
+        print("Starting upload performance test...")
+        upload_file_names = [f"test_file_upload_{i}.txt" for i in range(client_num)]
+        # Every file carries the same content; only its size matters to the test
+        create_test_files(upload_file_names, file_size_kb)
+        if use_batch:
+            write_batch_list(upload_file_names)  # Written before timing starts
+
+        # One long-lived client per simulated user, shared by the upload and read tests
+        clients = await asyncio.gather(*(start_client() for _ in range(1 if use_batch else client_num)))
+        start_ns = time.perf_counter_ns()
+        upload_times_ns = await run_on_files(clients, "upload", upload_file_names, use_batch)
+        # Operations overlap, so throughput is based on the wall-clock time of the whole phase
+        total_ns = time.perf_counter_ns() - start_ns
+
+        # Calculate and save upload metrics
+        # avg_ns = sum(upload_times_ns) // len(upload_times_ns)
+        # percentiles_ns = latency_percentiles(upload_times_ns)
+        # throughput = client_num * file_size_kb * NS_PER_SECOND / total_ns
+        # save_performance_results("upload_performance_results.txt", total_ns, avg_ns, percentiles_ns, throughput, client_num, file_size_kb, "Upload")
+
+        # Step 4: Read Performance Test
+        # Read back the files uploaded in Step 3 so that this phase times reads only
+        print("Starting read performance test...")
+        if cold_cache and drop_page_cache():
+            print("Dropped OS page cache; reads start from a cold cache")
+        start_ns = time.perf_counter_ns()
+        read_times_ns = await run_on_files(clients, "read", upload_file_names, use_batch)
+        total_ns_read = time.perf_counter_ns() - start_ns
+        await asyncio.gather(*(stop_client(client) for client in clients))
+
+        # Calculate and save read metrics
+        # Timings stay in integer nanoseconds until they are reported
+        avg_ns_read = sum(read_times_ns) // len(read_times_ns)
+        # A batch is timed as a whole, so there are no per-file latencies to take percentiles of
+        percentiles_ns_read = None if use_batch else latency_percentiles(read_times_ns)
+        throughput_read = client_num * file_size_kb * NS_PER_SECOND / total_ns_read
+        save_performance_results("read_performance_results.txt", total_ns_read, avg_ns_read, percentiles_ns_read, throughput_read, client_num, file_size_kb, "Read")
+
+        remove_files([PAYLOAD_TEMPLATE_FILE, BATCH_LIST_FILE] + upload_file_names)
+    finally:
+        # Terminate the servers even when a step above fails, so they do not keep their ports
+        for process in server_processes:
+            process.terminate()
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
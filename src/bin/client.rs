@@ -3,7 +3,7 @@ use chunk::{AppendRequest, DeleteRequest, FileChunk, FileInfo, ReadRequest, Uplo
 use rand::seq::SliceRandom;
 use std::env;
 use tokio::fs::File;
-use tokio::io::AsyncReadExt;
+use tokio::io::{AsyncBufReadExt, AsyncReadExt, BufReader};
 use tokio_stream::wrappers::ReceiverStream;
 use tonic::Request;
 use tracing::{debug, error, info};
@@ -21,6 +21,10 @@ pub mod chunk {
     tonic::include_proto!("chunk");
 }
 
+/// Prefix of the status line printed to stdout in REPL mode: "ready" once the client is
+/// connected, then "ok" or "error" after each command
+const REPL_STATUS_MARKER: &str = "__REPL_STATUS__";
+
 pub struct Client {
     common_config: CommonConfig,
     master_client: MasterClient<tonic::transport::Channel>,
@@ -86,11 +90,13 @@ impl Client {
 
     /// Randomly select a server address for each chunk for read operations
     pub async fn get_randomized_server_addresses(
-        &mut self,
+        &self,
         file_name: &str,
     ) -> Result<Vec<String>, Box<dyn std::error::Error>> {
+        // Clones share the underlying channel, which lets concurrent reads issue this request
         let response = self
             .master_client
+            .clone()
             .get_file_chunks(Request::new(FileChunkMappingRequest {
                 file_name: file_name.to_string(),
             }))
@@ -182,6 +188,45 @@ impl Client {
         Ok(all_server_addresses)
     }
 
+    /// Request a chunk assignment for a local file from the master and upload its chunks
+    pub async fn upload(&self, file_name: String) -> Result<(), Box<dyn std::error::Error>> {
+        let file_metadata = tokio::fs::metadata(&file_name).await.map_err(|e| {
+            error!("Failed to get metadata for file '{}': {}", file_name, e);
+            e
+        })?;
+        let file_size = file_metadata.len();
+        debug!("File size: {} bytes", file_size);
+
+        info!("Requesting chunk assignment for file: {}", file_name);
+        // Clones share the underlying channel, which lets concurrent uploads issue this request
+        let assign_response = self
+            .master_client
+            .clone()
+            .assign_chunks(Request::new(AssignRequest {
+                file_name: file_name.clone(),
+                file_size,
+            }))
+            .await?
+            .into_inner();
+        debug!("Got chunk assignment for file: {}", file_name);
+
+        self.upload_file(assign_response.chunk_info_list, file_name)
+            .await
+    }
+
+    /// Look up the chunk locations of a file from the master and read its content
+    pub async fn read(&self, file_name: &str) -> Result<String, Box<dyn std::error::Error>> {
+        let randomized_server_addresses = self
+            .get_randomized_server_addresses(file_name)
+            .await
+            .map_err(|e| {
+                error!("Error retrieving random server addresses: {}", e);
+                e
+            })?;
+
+        self.read_file(randomized_server_addresses, file_name).await
+    }
+
     pub async fn upload_file(
         &self,
         chunk_info_list: Vec<ChunkInfo>,
@@ -306,7 +351,6 @@ impl Client {
             file_content.push_str(&response.into_inner().content.trim_end());
         }
 
-        println!("{}", file_content);
         Ok(file_content)
     }
 
@@ -452,7 +496,8 @@ async fn main() -> Result<(), Box<dyn std::error::Error>> {
     let args: Vec<String> = env::args().collect();
     if args.len() < 2 {
         error!("Usage: client <command> [arguments] [-u <username>] [-p <password>]");
-        error!("Commands: upload <file_name>, read <file_name>, delete <file_name>, append <file_name> <data>");
+        error!("Commands: upload <file_name>, read <file_name>, delete <file_name>, append <file_name> <data>, repl");
+        error!("Use upload --batch <list_file> or read --batch <list_file> for a list of files, one per line");
         return Ok(());
     }
     let operation = args[1].as_str();
@@ -498,65 +543,79 @@ async fn main() -> Result<(), Box<dyn std::error::Error>> {
         }
     }
 
+    if operation == "repl" {
+        return run_repl(&mut client).await;
+    }
+
+    run_operation(&mut client, operation, &args[2..], true).await
+}
+
+/// Run a single client operation, where `params` are the arguments following the command name.
+/// Read content is printed to stdout only when `echo_content` is set.
+async fn run_operation(
+    client: &mut Client,
+    operation: &str,
+    params: &[String],
+    echo_content: bool,
+) -> Result<(), Box<dyn std::error::Error>> {
     match operation {
         "upload" => {
-            if args.len() < 3 {
-                error!("Usage: upload <file_name>");
-                return Ok(());
+            if params.is_empty() || (params[0] == "--batch" && params.len() < 2) {
+                return Err(operation_error(
+                    "Usage: upload <file_name> | upload --batch <list_file>",
+                ));
+            }
+            if params[0] == "--batch" {
+                // Upload every listed file concurrently over the same master connection
+                let file_names = read_batch_list(&params[1]).await?;
+                let results = futures::future::join_all(
+                    file_names
+                        .iter()
+                        .map(|file_name| client.upload(file_name.clone())),
+                )
+                .await;
+                return check_batch_results("upload", &file_names, results);
             }
-            let file_name = args[2].clone();
-            let file_metadata = tokio::fs::metadata(&file_name).await.map_err(|e| {
-                error!("Failed to get metadata for file '{}': {}", file_name, e);
-                e
-            })?;
-            let file_size = file_metadata.len();
-            debug!("File size: {} bytes", file_size);
-
-            info!("Requesting chunk assignment for file: {}", file_name);
-            let assign_response = client
-                .master_client
-                .assign_chunks(Request::new(AssignRequest {
-                    file_name: file_name.clone(),
-                    file_size,
-                }))
-                .await?
-                .into_inner();
-            debug!("Got chunk assignment for file: {}", file_name);
 
-            if let Err(e) = client
-                .upload_file(assign_response.chunk_info_list, file_name)
-                .await
-            {
+            client.upload(params[0].clone()).await.map_err(|e| {
                 error!("Error during upload: {}", e);
-            }
+                e
+            })?;
         }
         "read" => {
-            if args.len() < 3 {
-                error!("Usage: read <file_name>");
-                return Ok(());
+            if params.is_empty() || (params[0] == "--batch" && params.len() < 2) {
+                return Err(operation_error(
+                    "Usage: read <file_name> | read --batch <list_file>",
+                ));
+            }
+            if params[0] == "--batch" {
+                // Read every listed file concurrently over the same master connection
+                let file_names = read_batch_list(&params[1]).await?;
+                let results = futures::future::join_all(
+                    file_names.iter().map(|file_name| client.read(file_name)),
+                )
+                .await;
+                if echo_content {
+                    for file_content in results.iter().flatten() {
+                        println!("{}", file_content);
+                    }
+                }
+                return check_batch_results("read", &file_names, results);
             }
-            let file_name = args[2].as_str();
-            let randomized_server_addresses = client
-                .get_randomized_server_addresses(file_name)
-                .await
-                .map_err(|e| {
-                    error!("Error retrieving random server addresses: {}", e);
-                    e
-                })?;
 
-            if let Err(e) = client
-                .read_file(randomized_server_addresses, file_name)
-                .await
-            {
+            let file_content = client.read(params[0].as_str()).await.map_err(|e| {
                 error!("Error during read: {}", e);
+                e
+            })?;
+            if echo_content {
+                println!("{}", file_content);
             }
         }
         "delete" => {
-            if args.len() < 3 {
-                error!("Usage: delete <file_name>");
-                return Ok(());
+            if params.is_empty() {
+                return Err(operation_error("Usage: delete <file_name>"));
             }
-            let file_name = args[2].as_str();
+            let file_name = params[0].as_str();
 
             // Obtain a complete list of addresses
             let all_server_addresses =
@@ -569,8 +628,10 @@ async fn main() -> Result<(), Box<dyn std::error::Error>> {
                     })?;
 
             if all_server_addresses.is_empty() {
-                error!("No chunk servers found for file '{}'.", file_name);
-                return Ok(());
+                return Err(operation_error(&format!(
+                    "No chunk servers found for file '{}'.",
+                    file_name
+                )));
             }
 
             // Create DeleteFileRequest for metadata on the Master node
@@ -584,31 +645,34 @@ async fn main() -> Result<(), Box<dyn std::error::Error>> {
                     if response.get_ref().success {
                         info!("File '{}' deleted successfully.", file_name);
                     } else {
-                        error!(
+                        // Stop further execution if the deletion failed
+                        return Err(operation_error(&format!(
                             "Failed to delete file '{}': {}",
                             file_name,
                             response.get_ref().message
-                        );
-                        return Ok(()); // Stop further execution if the deletion failed
+                        )));
                     }
                 }
                 Err(e) => {
                     error!("Error during delete: {}", e);
-                    return Ok(()); // Stop further execution if the RPC call failed
+                    return Err(Box::new(e)); // Stop further execution if the RPC call failed
                 }
             }
 
-            if let Err(e) = client.delete_file(all_server_addresses, file_name).await {
-                error!("Error during delete: {}", e);
-            }
+            client
+                .delete_file(all_server_addresses, file_name)
+                .await
+                .map_err(|e| {
+                    error!("Error during delete: {}", e);
+                    e
+                })?;
         }
         "append" => {
-            if args.len() < 4 {
-                error!("Usage: append <file_name> <data>");
-                return Ok(());
+            if params.len() < 2 {
+                return Err(operation_error("Usage: append <file_name> <data>"));
             }
-            let file_name = args[2].as_str();
-            let data = args[3].to_string();
+            let file_name = params[0].as_str();
+            let data = params[1].to_string();
             let all_server_addresses =
                 client
                     .get_all_server_addresses(file_name)
@@ -618,16 +682,100 @@ async fn main() -> Result<(), Box<dyn std::error::Error>> {
                         e
                     })?;
 
-            if let Err(e) = client
+            client
                 .append_file(all_server_addresses, file_name, data)
                 .await
-            {
-                error!("Error during append: {}", e);
-            }
+                .map_err(|e| {
+                    error!("Error during append: {}", e);
+                    e
+                })?;
         }
         _ => {
-            error!("Invalid command. Available commands: upload, read, delete, append");
+            return Err(operation_error(
+                "Invalid command. Available commands: upload, read, delete, append, repl",
+            ));
+        }
+    }
+
+    Ok(())
+}
+
+/// Log a failed operation and return it as an error, so that the REPL reports its status as "error"
+fn operation_error(message: &str) -> Box<dyn std::error::Error> {
+    error!("{}", message);
+    Box::new(std::io::Error::new(
+        std::io::ErrorKind::InvalidInput,
+        message.to_string(),
+    ))
+}
+
+/// Read the file names of a batch operation from a list file, one name per line
+async fn read_batch_list(list_path: &str) -> Result<Vec<String>, Box<dyn std::error::Error>> {
+    let content = tokio::fs::read_to_string(list_path).await.map_err(|e| {
+        error!("Failed to read batch list '{}': {}", list_path, e);
+        e
+    })?;
+
+    Ok(content
+        .lines()
+        .map(str::trim)
+        .filter(|line| !line.is_empty())
+        .map(String::from)
+        .collect())
+}
+
+/// Log every failed operation of a batch, returning an error if any of them failed
+fn check_batch_results<T>(
+    operation: &str,
+    file_names: &[String],
+    results: Vec<Result<T, Box<dyn std::error::Error>>>,
+) -> Result<(), Box<dyn std::error::Error>> {
+    let mut failed = 0;
+    for (file_name, result) in file_names.iter().zip(results) {
+        if let Err(e) = result {
+            error!("Error during {} of '{}': {}", operation, file_name, e);
+            failed += 1;
+        }
+    }
+
+    if failed > 0 {
+        return Err(Box::new(std::io::Error::new(
+            std::io::ErrorKind::Other,
+            format!("{} of {} {}s failed", failed, file_names.len(), operation),
+        )));
+    }
+
+    info!(
+        "Batch {} of {} files completed",
+        operation,
+        file_names.len()
+    );
+    Ok(())
+}
+
+/// Read commands from stdin, one per line, and run each against the same client so that
+/// callers issuing many operations pay the process startup and master connection cost once
+async fn run_repl(client: &mut Client) -> Result<(), Box<dyn std::error::Error>> {
+    let mut lines = BufReader::new(tokio::io::stdin()).lines();
+    println!("{} ready", REPL_STATUS_MARKER);
+    while let Some(line) = lines.next_line().await? {
+        let params: Vec<String> = line.split_whitespace().map(String::from).collect();
+        if params.is_empty() {
+            continue;
+        }
+        if params[0] == "exit" {
+            break;
         }
+
+        // Read content is not echoed, so stdout only carries the status lines
+        let status = match run_operation(client, &params[0], &params[1..], false).await {
+            Ok(()) => "ok",
+            Err(e) => {
+                error!("Error during {}: {}", params[0], e);
+                "error"
+            }
+        };
+        println!("{} {}", REPL_STATUS_MARKER, status);
     }
 
     Ok(())